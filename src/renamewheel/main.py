@@ -1,35 +1,398 @@
 import argparse
-import os.path
+import errno
+import functools
+import os
+import re
+import stat
 import sys
 
-from os.path import basename, isfile
-from shutil import copyfile
+from os.path import abspath, dirname, expanduser, isdir, join, realpath
 
-from auditwheel.policy import WheelPolicies
-from auditwheel.wheel_abi import NonPlatformWheel, analyze_wheel_abi
+from renamewheel import __version__
 
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
 
-def _parse_args():
+
+# Built on first use rather than at import, adding arguments makes argparse
+# load its help formatter and shutil.
+@functools.lru_cache(maxsize=None)
+def _parser():
     p = argparse.ArgumentParser(description="Rename Linux Python wheels.")
-    p.add_argument("WHEEL_FILE", help="Path to wheel file.")
-    p.add_argument("-w", "--working-dir", help="Working directory")
+    p.add_argument("WHEEL_FILE", nargs="+", help="Path to wheel file(s).")
+    p.add_argument("--version", action="version", version=__version__)
+    p.add_argument("-w", "--working-dir", help="Working directory, the wheel is moved here.")
+    transfer = p.add_mutually_exclusive_group()
+    transfer.add_argument("--copy", action="store_true", help="Copy, keeping the original.")
+    transfer.add_argument("--link", action="store_true", help="Hard link, keeping the original.")
+
+    return p
+
+
+def _parse_args():
+    return _parser().parse_args()
+
+
+# Buffer size for the userspace copy fallback, larger than shutil's default
+# to cut down on read/write syscalls for multi-megabyte wheels.
+_COPY_BUFSIZE = 1024 * 1024
+
+# FICLONE from <linux/fs.h>.
+_FICLONE = 0x40049409
+
+
+def _try_reflink(src_fd, dst_fd):
+    """Clone *src_fd* into *dst_fd* with the FICLONE ioctl.
+
+    Returns ``True`` if the filesystem made a copy-on-write clone and
+    ``False`` if reflinks are not supported here.
+    """
+    if fcntl is None or sys.platform != "linux":
+        return False
+
+    try:
+        fcntl.ioctl(dst_fd, _FICLONE, src_fd)
+    except OSError as e:
+        if e.errno in (errno.EOPNOTSUPP, errno.EXDEV, errno.EINVAL, errno.ENOTTY):
+            return False
+        raise
+
+    return True
+
+
+# Errors meaning a copy mechanism is unsupported here, rather than a real
+# IO failure, so the next one should be tried.
+_COPY_FALLBACK_ERRNOS = (errno.EXDEV, errno.ENOSYS, errno.EINVAL,
+                         errno.EOPNOTSUPP, errno.ENOTSUP)
+
+
+def _seek(src_fd, dst_fd, offset):
+    os.lseek(src_fd, offset, os.SEEK_SET)
+    os.lseek(dst_fd, offset, os.SEEK_SET)
+
+
+def _copy_file_range(src_fd, dst_fd, size):
+    offset = 0
+    while offset < size:
+        copied = os.copy_file_range(src_fd, dst_fd, size - offset)
+        if copied == 0:
+            break
+        offset += copied
+    return offset
+
+
+def _sendfile(src_fd, dst_fd, offset, size):
+    while offset < size:
+        sent = os.sendfile(dst_fd, src_fd, offset, size - offset)
+        if sent == 0:
+            break
+        offset += sent
+    return offset
+
+
+def _readinto(src_fd, dst_fd):
+    buf = bytearray(_COPY_BUFSIZE)
+    view = memoryview(buf)
+    with open(src_fd, "rb", buffering=0, closefd=False) as src, \
+            open(dst_fd, "wb", buffering=0, closefd=False) as dst:
+        n = src.readinto(buf)
+        while n:
+            # Unbuffered writes may be short.
+            written = 0
+            while written < n:
+                written += dst.write(view[written:n])
+            n = src.readinto(buf)
+
+
+def _fast_copy(src, dst):
+    """Copy *src* to *dst*, keeping the bytes in kernel space where possible.
+
+    Tries a reflink clone first, then ``os.copy_file_range``, then
+    ``os.sendfile``, and finally falls back to a plain ``readinto`` loop.
+    File metadata is copied afterwards with ``shutil.copystat``.
+    """
+    from shutil import SameFileError, copystat
+
+    cloexec = getattr(os, "O_CLOEXEC", 0)
+    src_fd = os.open(src, os.O_RDONLY | cloexec)
+    try:
+        # Only truncate once we know dst is not src, e.g. through a hard link.
+        dst_fd = os.open(dst, os.O_WRONLY | os.O_CREAT | cloexec, 0o644)
+        try:
+            src_st = os.fstat(src_fd)
+            dst_st = os.fstat(dst_fd)
+            if (src_st.st_dev, src_st.st_ino) == (dst_st.st_dev, dst_st.st_ino):
+                raise SameFileError(f"{src!r} and {dst!r} are the same file")
+            os.ftruncate(dst_fd, 0)
+
+            size = src_st.st_size
+            if hasattr(os, "posix_fadvise"):
+                os.posix_fadvise(src_fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+            offset = size if _try_reflink(src_fd, dst_fd) else 0
+            # A failed stage may have moved either file position, restart each
+            # stage from the last offset known to be fully copied.
+            if offset < size and hasattr(os, "copy_file_range"):
+                try:
+                    offset = _copy_file_range(src_fd, dst_fd, size)
+                except OSError as e:
+                    if e.errno not in _COPY_FALLBACK_ERRNOS:
+                        raise
+            if offset < size and hasattr(os, "sendfile"):
+                _seek(src_fd, dst_fd, offset)
+                try:
+                    offset = _sendfile(src_fd, dst_fd, offset, size)
+                except OSError as e:
+                    if e.errno not in _COPY_FALLBACK_ERRNOS:
+                        raise
+            if offset < size:
+                _seek(src_fd, dst_fd, offset)
+                _readinto(src_fd, dst_fd)
+        finally:
+            os.close(dst_fd)
+    finally:
+        os.close(src_fd)
+
+    copystat(src, dst)
+
+
+@functools.lru_cache(maxsize=None)
+def _auditwheel_version():
+    # auditwheel does not define __version__, read it from the package metadata.
+    from importlib import metadata
+
+    return metadata.version("auditwheel")
+
+
+def _cache_file(key):
+    # Each result lives in its own file so concurrent runs never overwrite
+    # each other's entries, and results from other auditwheel releases are
+    # never reused.
+    import hashlib
+
+    cache_home = os.environ.get("XDG_CACHE_HOME")
+    if not cache_home:
+        cache_home = join(expanduser("~"), ".cache")
+    cache_dir = join(cache_home, "renamewheel", f"abi-{_auditwheel_version()}")
+    digest = hashlib.blake2b(key.encode(), digest_size=16).hexdigest()
+    return join(cache_dir, f"{digest}.json")
+
+
+def _cache_key(wheel_file, st):
+    return f"{st.st_size}:{st.st_mtime_ns}:{abspath(wheel_file)}"
+
+
+def _load_cached_result(key):
+    import json
+
+    try:
+        with open(_cache_file(key)) as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if not isinstance(entry, dict) or entry.get("key") != key:
+        return None
+    if not isinstance(entry.get("from"), str) or not isinstance(entry.get("to"), str):
+        return None
+
+    return {"from": entry["from"], "to": entry["to"]}
+
+
+def _store_cached_result(key, result):
+    import json
+
+    cache_file = _cache_file(key)
+    tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(dirname(cache_file), exist_ok=True)
+        with open(tmp_file, "w") as f:
+            json.dump(dict(result, key=key), f)
+        os.replace(tmp_file, cache_file)
+    except OSError:
+        pass
+
+
+_WHEEL_TAG_RE = re.compile(rb"^Tag:[ \t]*(\S+)", re.M)
+
 
-    return p.parse_args()
+def _wheel_tags(wheel_file):
+    """Return the ``Tag`` entries from the wheel's ``.dist-info/WHEEL`` file.
+
+    Returns ``None`` if the metadata cannot be read, leaving the decision to
+    auditwheel.
+    """
+    import zipfile
+
+    try:
+        with zipfile.ZipFile(wheel_file) as zf:
+            for name in zf.namelist():
+                if name.endswith(".dist-info/WHEEL") and name.count("/") == 1:
+                    return [tag.decode() for tag in _WHEEL_TAG_RE.findall(zf.read(name))]
+    except (OSError, zipfile.BadZipFile):
+        pass
+
+    return None
+
+
+@functools.lru_cache(maxsize=None)
+def _wheel_policies():
+    from auditwheel.policy import WheelPolicies
+
+    return WheelPolicies()
 
 
 def _analyse_wheel(wheel_file):
-    if not isfile(wheel_file):
+    try:
+        # O_NONBLOCK stops the open hanging on a FIFO before it can be rejected.
+        fd = os.open(wheel_file, os.O_RDONLY | os.O_NONBLOCK | getattr(os, "O_CLOEXEC", 0))
+    except (FileNotFoundError, NotADirectoryError):
+        print(f"cannot access {wheel_file}. No such file")
+        return 2
+    except OSError as e:
+        print(f"cannot access {wheel_file}. {e.strerror}")
+        return 2
+
+    st = os.fstat(fd)
+    if not stat.S_ISREG(st.st_mode):
+        os.close(fd)
         print(f"cannot access {wheel_file}. No such file")
         return 2
+    os.set_blocking(fd, True)
+
+    with os.fdopen(fd, "rb") as f:
+        key = _cache_key(wheel_file, st)
+        result = _load_cached_result(key)
+        if result is not None:
+            return result
+
+        # Start filling the page cache with the wheel for auditwheel's scan,
+        # which reopens it by path.
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(fd, 0, st.st_size, os.POSIX_FADV_WILLNEED)
+
+        tags = _wheel_tags(f)
+
+    if tags and all(tag.endswith("-any") for tag in tags):
+        print("This does not look like a platform wheel")
+        return 3
+
+    # auditwheel is slow to import, only pay for it when a wheel needs analysing.
+    from auditwheel.wheel_abi import NonPlatformWheel, analyze_wheel_abi
 
     try:
-        wheel_policy = WheelPolicies()
-        winfo = analyze_wheel_abi(wheel_policy, wheel_file, frozenset())
+        winfo = analyze_wheel_abi(_wheel_policies(), wheel_file, frozenset())
     except NonPlatformWheel:
         print("This does not look like a platform wheel")
         return 3
 
-    return {"from": winfo.overall_tag, "to": winfo.sym_tag}
+    result = {"from": winfo.overall_tag, "to": winfo.sym_tag}
+    _store_cached_result(key, result)
+
+    return result
+
+
+def _analysis_errors():
+    # Evaluated only once an exception is being handled, keeping the imports lazy.
+    import zipfile
+
+    from auditwheel.error import AuditwheelException
+    from auditwheel.wheel_abi import WheelAbiError
+
+    return OSError, zipfile.BadZipFile, AuditwheelException, WheelAbiError
+
+
+def _analysis_failed(wheel_file, e):
+    print(f"Failed to analyse {wheel_file}: {e}")
+    return 5
+
+
+def _analyse_wheels(wheel_files):
+    if len(wheel_files) == 1:
+        try:
+            return [_analyse_wheel(wheel_files[0])]
+        except _analysis_errors() as e:
+            return [_analysis_failed(wheel_files[0], e)]
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    results = []
+    max_workers = min(len(wheel_files), os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(_analyse_wheel, wheel_file) for wheel_file in wheel_files]
+        for wheel_file, future in zip(wheel_files, futures):
+            try:
+                results.append(future.result())
+            except _analysis_errors() as e:
+                results.append(_analysis_failed(wheel_file, e))
+
+    return results
+
+
+def _same_file(src, dst):
+    try:
+        src_st = os.stat(src)
+        dst_st = os.stat(dst)
+    except FileNotFoundError:
+        return False
+
+    return (src_st.st_dev, src_st.st_ino) == (dst_st.st_dev, dst_st.st_ino)
+
+
+def _try_link(src, dst):
+    """Hard link *dst* to *src*.
+
+    Returns ``False`` if a link cannot be made and the wheel should be copied
+    instead.
+    """
+    try:
+        os.link(src, dst)
+    except OSError as e:
+        if e.errno == errno.EEXIST:
+            return _same_file(src, dst)
+        if e.errno in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP):
+            return False
+        raise
+
+    return True
+
+
+def _rename_wheel(wheel_file, result, args):
+    from pathlib import Path
+
+    src = Path(wheel_file)
+    # Only the trailing platform tag component should change.
+    head, sep, platform_tag = src.name.rpartition("-")
+    current_tag = platform_tag[:-len(".whl")] if platform_tag.endswith(".whl") else platform_tag
+    if current_tag == result["to"] and not args.working_dir:
+        print("Name hasn't changed, doing nothing.")
+        return 0
+
+    renamed_file_name = f"{head}{sep}{platform_tag.replace(result['from'], result['to'])}"
+    renamed_wheel_file = Path(args.working_dir or src.parent) / renamed_file_name
+
+    src_abs = realpath(wheel_file)
+    dst_abs = realpath(renamed_wheel_file)
+    # A hard link left by an earlier --link run has a different path but is
+    # the same file, copying or moving onto it would destroy the wheel.
+    if src_abs == dst_abs or _same_file(src_abs, dst_abs):
+        print("Name hasn't changed, doing nothing.")
+        return 0
+
+    print(f"Renaming '{wheel_file}' to '{renamed_wheel_file}'.")
+    same_device = os.stat(src_abs).st_dev == os.stat(dirname(dst_abs)).st_dev
+    if args.link:
+        if not (same_device and _try_link(src_abs, dst_abs)):
+            _fast_copy(wheel_file, renamed_wheel_file)
+    elif args.copy:
+        _fast_copy(wheel_file, renamed_wheel_file)
+    elif same_device:
+        os.rename(src_abs, dst_abs)
+    else:
+        _fast_copy(wheel_file, renamed_wheel_file)
+        os.unlink(src_abs)
+    return 0
 
 
 def main():
@@ -39,20 +402,31 @@ def main():
 
     args = _parse_args()
 
-    result = _analyse_wheel(args.WHEEL_FILE)
-    if isinstance(result, int):
-        return result
+    if args.working_dir and not isdir(args.working_dir):
+        print(f"Output directory {args.working_dir!r} does not exist.")
+        return 4
 
-    file_name = basename(args.WHEEL_FILE)
-    renamed_file_name = file_name.replace(result["from"], result["to"])
-    if args.working_dir:
-        renamed_wheel_file = os.path.join(args.working_dir, renamed_file_name)
-    else:
-        renamed_wheel_file = args.WHEEL_FILE.replace(result["from"], result["to"])
+    # The same wheel given twice would be moved away before its second rename.
+    unique_wheel_files = {}
+    for wheel_file in args.WHEEL_FILE:
+        unique_wheel_files.setdefault(realpath(wheel_file), wheel_file)
+    wheel_files = list(unique_wheel_files.values())
 
-    print(f"Renaming '{args.WHEEL_FILE}' to '{renamed_wheel_file}'.")
-    copyfile(args.WHEEL_FILE, renamed_wheel_file)
-    return 0
+    return_code = 0
+    results = _analyse_wheels(wheel_files)
+    for wheel_file, result in zip(wheel_files, results):
+        if isinstance(result, int):
+            return_code = return_code or result
+            continue
+
+        try:
+            rename_code = _rename_wheel(wheel_file, result, args)
+        except OSError as e:
+            print(f"Failed to rename {wheel_file}: {e}")
+            rename_code = 6
+        return_code = return_code or rename_code
+
+    return return_code
 
 
 if __name__ == "__main__":
@@ -0,0 +1,288 @@
+import contextlib
+import errno
+import io
+import os
+import shutil
+import sys
+import tempfile
+import types
+import unittest
+import zipfile
+
+from unittest import mock
+
+import renamewheel
+
+from renamewheel import main
+
+
+class FastCopyTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+        self._src = os.path.join(self._dir, "a.whl")
+        with open(self._src, "wb") as f:
+            f.write(os.urandom(3 * 1024 * 1024 + 17))
+
+    def tearDown(self):
+        shutil.rmtree(self._dir)
+
+    def _read(self, path):
+        with open(path, "rb") as f:
+            return f.read()
+
+    def test_copy(self):
+        dst = os.path.join(self._dir, "b.whl")
+        main._fast_copy(self._src, dst)
+        self.assertEqual(self._read(self._src), self._read(dst))
+
+    def test_copy_over_existing(self):
+        dst = os.path.join(self._dir, "b.whl")
+        with open(dst, "wb") as f:
+            f.write(b"x" * (5 * 1024 * 1024))
+        main._fast_copy(self._src, dst)
+        self.assertEqual(self._read(self._src), self._read(dst))
+
+    def test_hard_link_is_not_truncated(self):
+        content = self._read(self._src)
+        dst = os.path.join(self._dir, "b.whl")
+        os.link(self._src, dst)
+        self.assertRaises(shutil.SameFileError, main._fast_copy, self._src, dst)
+        self.assertEqual(content, self._read(self._src))
+        self.assertEqual(content, self._read(dst))
+
+    @unittest.skipUnless(hasattr(os, "copy_file_range"), "requires os.copy_file_range")
+    def test_copy_file_range_fails_part_way(self):
+        copy_file_range = os.copy_file_range
+        calls = []
+
+        def _failing_copy_file_range(src_fd, dst_fd, count):
+            calls.append(count)
+            if len(calls) > 1:
+                raise OSError(errno.EXDEV, os.strerror(errno.EXDEV))
+            return copy_file_range(src_fd, dst_fd, min(count, 1024 * 1024))
+
+        dst = os.path.join(self._dir, "b.whl")
+        with mock.patch.object(main, "_try_reflink", return_value=False), \
+                mock.patch("os.copy_file_range", _failing_copy_file_range, create=True):
+            main._fast_copy(self._src, dst)
+        self.assertEqual(self._read(self._src), self._read(dst))
+
+    def test_short_writes(self):
+        class _ShortFileIO(io.FileIO):
+            def write(self, b):
+                return super().write(b[:4096])
+
+        def _open(fd, mode, **kwargs):
+            return _ShortFileIO(fd, mode[0], closefd=False)
+
+        dst = os.path.join(self._dir, "b.whl")
+        dst_fd = os.open(dst, os.O_WRONLY | os.O_CREAT)
+        src_fd = os.open(self._src, os.O_RDONLY)
+        try:
+            with mock.patch.object(main, "open", _open, create=True):
+                main._readinto(src_fd, dst_fd)
+        finally:
+            os.close(src_fd)
+            os.close(dst_fd)
+        self.assertEqual(self._read(self._src), self._read(dst))
+
+    def test_sendfile_error_is_raised(self):
+        def _failing_sendfile(*args):
+            raise OSError(errno.EIO, os.strerror(errno.EIO))
+
+        dst = os.path.join(self._dir, "b.whl")
+        with mock.patch.object(main, "_try_reflink", return_value=False), \
+                mock.patch("os.copy_file_range", side_effect=OSError(errno.EXDEV, "xdev"), create=True), \
+                mock.patch("os.sendfile", _failing_sendfile):
+            self.assertRaises(OSError, main._fast_copy, self._src, dst)
+
+
+class WheelTagsTestCase(unittest.TestCase):
+
+    def _tags(self, metadata):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            wheel_file = os.path.join(tmp_dir, "a-1.0-py3-none-any.whl")
+            with zipfile.ZipFile(wheel_file, "w") as zf:
+                zf.writestr("a-1.0.dist-info/WHEEL", metadata)
+            return main._wheel_tags(wheel_file)
+
+    def test_tags(self):
+        self.assertEqual(["cp311-cp311-linux_x86_64", "cp311-abi3-linux_x86_64"],
+                         self._tags("Wheel-Version: 1.0\nTag: cp311-cp311-linux_x86_64\n"
+                                    "Tag: cp311-abi3-linux_x86_64\n"))
+
+    def test_empty_tag(self):
+        self.assertEqual([], self._tags("Tag:\nRoot-Is-Purelib: true\n"))
+
+
+class AnalyseWheelTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._dir)
+
+    def test_missing_file(self):
+        self.assertEqual(2, main._analyse_wheel(os.path.join(self._dir, "a-1.0-py3-none-any.whl")))
+
+    def test_directory(self):
+        self.assertEqual(2, main._analyse_wheel(self._dir))
+
+    def test_fifo(self):
+        fifo = os.path.join(self._dir, "a-1.0-py3-none-any.whl")
+        os.mkfifo(fifo)
+        self.assertEqual(2, main._analyse_wheel(fifo))
+
+
+class AnalyseWheelsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        class _Error(Exception):
+            pass
+
+        self._patch = mock.patch.dict(sys.modules, {
+            "auditwheel": types.SimpleNamespace(),
+            "auditwheel.error": types.SimpleNamespace(AuditwheelException=_Error),
+            "auditwheel.wheel_abi": types.SimpleNamespace(WheelAbiError=_Error),
+        })
+        self._patch.start()
+
+    def tearDown(self):
+        self._patch.stop()
+
+    def test_expected_error(self):
+        with mock.patch.object(main, "_analyse_wheel", side_effect=zipfile.BadZipFile("bad")):
+            self.assertEqual([5], main._analyse_wheels(["a-1.0-cp311-cp311-linux_x86_64.whl"]))
+
+    def test_unexpected_error(self):
+        with mock.patch.object(main, "_analyse_wheel", side_effect=RuntimeError("bug")):
+            self.assertRaises(RuntimeError, main._analyse_wheels, ["a-1.0-cp311-cp311-linux_x86_64.whl"])
+
+
+class CacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+        self._patches = [
+            mock.patch.dict(os.environ, {"XDG_CACHE_HOME": self._dir}),
+            mock.patch.object(main, "_auditwheel_version", return_value="1.0"),
+        ]
+        for patch in self._patches:
+            patch.start()
+
+    def tearDown(self):
+        for patch in reversed(self._patches):
+            patch.stop()
+        shutil.rmtree(self._dir)
+
+    def test_round_trip(self):
+        result = {"from": "linux_x86_64", "to": "manylinux_2_17_x86_64"}
+        main._store_cached_result("a", result)
+        main._store_cached_result("b", {"from": "linux_x86_64", "to": "manylinux_2_28_x86_64"})
+        self.assertEqual(result, main._load_cached_result("a"))
+        self.assertIsNone(main._load_cached_result("c"))
+
+    def test_other_auditwheel_version(self):
+        main._store_cached_result("a", {"from": "linux_x86_64", "to": "manylinux_2_17_x86_64"})
+        main._auditwheel_version.return_value = "2.0"
+        self.assertIsNone(main._load_cached_result("a"))
+
+    def test_invalid_entry(self):
+        cache_file = main._cache_file("a")
+        os.makedirs(os.path.dirname(cache_file))
+        with open(cache_file, "w") as f:
+            f.write('{"key": "a", "from": "linux_x86_64"}')
+        self.assertIsNone(main._load_cached_result("a"))
+
+
+class MainTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+        self._wheel = os.path.join(self._dir, "a-1.0-cp311-cp311-linux_x86_64.whl")
+        with open(self._wheel, "wb") as f:
+            f.write(b"wheel")
+
+    def tearDown(self):
+        shutil.rmtree(self._dir)
+
+    def _main(self, *argv):
+        def _analyse_wheels(wheel_files):
+            return [{"from": "linux_x86_64", "to": "manylinux_2_17_x86_64"}] * len(wheel_files)
+
+        with mock.patch.object(sys, "argv", ["renamewheel", *argv]), \
+                mock.patch.object(main, "_analyse_wheels", side_effect=_analyse_wheels) as analyse:
+            return main.main(), analyse
+
+    def test_duplicate_wheels(self):
+        duplicate = os.path.join(self._dir, ".", os.path.basename(self._wheel))
+        return_code, analyse = self._main(self._wheel, duplicate)
+        self.assertEqual(0, return_code)
+        analyse.assert_called_once_with([self._wheel])
+        self.assertEqual(["a-1.0-cp311-cp311-manylinux_2_17_x86_64.whl"], os.listdir(self._dir))
+
+    def test_tag_already_in_name(self):
+        wheel_file = os.path.join(self._dir, "a-1.0-cp311-cp311-manylinux_2_17_x86_64.whl")
+        os.rename(self._wheel, wheel_file)
+        with mock.patch.object(main, "_fast_copy") as fast_copy, mock.patch("os.rename") as rename:
+            return_code, _ = self._main(wheel_file)
+        self.assertEqual(0, return_code)
+        fast_copy.assert_not_called()
+        rename.assert_not_called()
+
+    def test_link_then_copy(self):
+        content = b"wheel"
+        renamed_wheel = os.path.join(self._dir, "a-1.0-cp311-cp311-manylinux_2_17_x86_64.whl")
+        self.assertEqual(0, self._main("--link", self._wheel)[0])
+        self.assertEqual(0, self._main("--copy", self._wheel)[0])
+        self.assertEqual(0, self._main(self._wheel)[0])
+        for wheel_file in (self._wheel, renamed_wheel):
+            with open(wheel_file, "rb") as f:
+                self.assertEqual(content, f.read())
+
+    def test_move_across_devices(self):
+        working_dir = os.path.join(self._dir, "dist")
+        os.mkdir(working_dir)
+        stat = os.stat
+
+        def _stat(path, *args, **kwargs):
+            st = stat(path, *args, **kwargs)
+            if path == os.path.realpath(working_dir):
+                fields = list(st)
+                fields[2] += 1
+                st = os.stat_result(fields)
+            return st
+
+        with mock.patch("os.stat", _stat), mock.patch("os.rename") as rename:
+            return_code, _ = self._main("-w", working_dir, self._wheel)
+        self.assertEqual(0, return_code)
+        rename.assert_not_called()
+        self.assertFalse(os.path.exists(self._wheel))
+        with open(os.path.join(working_dir, "a-1.0-cp311-cp311-manylinux_2_17_x86_64.whl"), "rb") as f:
+            self.assertEqual(b"wheel", f.read())
+
+    def test_missing_working_dir(self):
+        return_code, analyse = self._main("-w", os.path.join(self._dir, "missing"), self._wheel)
+        self.assertEqual(4, return_code)
+        analyse.assert_not_called()
+
+    def test_version(self):
+        stdout = io.StringIO()
+        with mock.patch.object(sys, "argv", ["renamewheel", "--version"]), \
+                mock.patch.object(main, "_analyse_wheels") as analyse, \
+                contextlib.redirect_stdout(stdout), self.assertRaises(SystemExit) as cm:
+            main.main()
+        self.assertEqual(0, cm.exception.code)
+        analyse.assert_not_called()
+        self.assertEqual(renamewheel.__version__, stdout.getvalue().strip())
+
+    def test_rename_failure(self):
+        with mock.patch("os.rename", side_effect=PermissionError(13, "Permission denied")):
+            return_code, _ = self._main(self._wheel)
+        self.assertEqual(6, return_code)
+
+
+if __name__ == "__main__":
+    unittest.main()